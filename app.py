@@ -6,9 +6,16 @@ import streamlit as st
 import pandas as pd
 import os
 import io
+import shutil
+import tempfile
+import time
 import zipfile
+from collections.abc import Callable
+from contextlib import contextmanager
+from functools import partial
 import qrcode
-import qrcode.image.svg
+import numpy as np
+from PIL import Image
 from barcode import Code128, EAN13
 from barcode.writer import ImageWriter
 from datetime import datetime
@@ -16,58 +23,126 @@ from datetime import datetime
 # ------------------------------------------------------------
 # Helpers: QR encoders (PNG / SVG)
 # ------------------------------------------------------------
-def qr_png_bytes(data: str) -> bytes:
-    img = qrcode.make(data)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    return buf.getvalue()
-
-def qr_svg_bytes(data: str) -> bytes:
-    factory = qrcode.image.svg.SvgImage
-    svg_img = qrcode.make(data, image_factory=factory)
-    buf = io.BytesIO()
-    svg_img.save(buf)
-    buf.seek(0)
-    return buf.getvalue()
+# QR geometry (qrcode's defaults)
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+
+def qr_matrix(data: str) -> np.ndarray:
+    # Module matrix with the quiet-zone border included; True = dark module.
+    # Built from qr.modules with np.pad, which skips get_matrix()'s
+    # list-of-lists copy and hands both renderers a ready-made array.
+    qr = qrcode.QRCode(box_size=QR_BOX_SIZE, border=QR_BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return np.pad(np.array(qr.modules, dtype=bool), QR_BORDER)
+
+# The renderers take an already encoded matrix, so a PNG + SVG pair costs one
+# QR encode. PNGs are written straight into an open binary file, so batch
+# exports do not need an intermediate BytesIO per image.
+def write_qr_png(modules: np.ndarray, fp) -> None:
+    # Scale the module matrix up to pixels with NumPy rather than letting PIL
+    # draw every module box separately.
+    pixels = (~modules).repeat(QR_BOX_SIZE, axis=0).repeat(QR_BOX_SIZE, axis=1)
+    Image.fromarray(pixels).save(fp, format="PNG")
+
+def qr_svg_bytes(modules: np.ndarray) -> bytes:
+    # Same 1 mm-per-module geometry as qrcode's SvgImage, but written as one
+    # string with a single <path>: one subpath per horizontal run of dark
+    # modules rather than one element per module.
+    size = len(modules)
+    # Run starts/ends are where a row (padded with light modules) switches
+    # between light and dark; nonzero() yields both in the same row-major order.
+    edges = np.diff(np.pad(modules, ((0, 0), (1, 1))).view(np.int8), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+    runs = [
+        f"M{c} {r}h{w}v1h-{w}z"
+        for r, c, w in zip(rows.tolist(), starts.tolist(), (ends - starts).tolist())
+    ]
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="{size}mm" height="{size}mm" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<path d="{"".join(runs)}"/></svg>'
+    ).encode("utf-8")
+
+def qr_png_svg_bytes(data: str) -> tuple[bytes, bytes]:
+    matrix = qr_matrix(data)
+    png_buf = io.BytesIO()
+    write_qr_png(matrix, png_buf)
+    return png_buf.getvalue(), qr_svg_bytes(matrix)
+
+# Interactive tabs regenerate the same QR on repeated clicks; reuse the bytes.
+@st.cache_data(max_entries=128, show_spinner=False)
+def cached_qr_png_svg_bytes(data: str) -> tuple[bytes, bytes]:
+    return qr_png_svg_bytes(data)
 
 # ------------------------------------------------------------
 # vCard generator
 # ------------------------------------------------------------
+# Columns of the Employee Directory template / batch vCard upload.
+EMPLOYEE_COLUMNS = [
+    "FirstName", "LastName", "Position", "Department",
+    "Phone", "Email", "Company", "Website",
+    "Location", "MapsLink", "Notes"
+]
+
+# Optional vCard lines, emitted in this order when the field is non-empty.
+VCARD_OPTIONAL_FIELDS = [
+    ("Phone", "TEL;TYPE=CELL,VOICE:{}"),
+    ("Email", "EMAIL;TYPE=PREF,INTERNET:{}"),
+    ("Department", "NOTE:Department - {}"),
+    ("Location", "ADR;TYPE=WORK:;;{}"),
+    ("Website", "URL:{}"),
+    ("MapsLink", "URL:{}"),
+    ("Notes", "NOTE:{}"),
+]
+
 def create_vcard(employee: dict) -> str:
-    v = []
-    v.append("BEGIN:VCARD")
-    v.append("VERSION:3.0")
-    v.append(f"N:{employee.get('LastName','')};{employee.get('FirstName','')};;;")
-    v.append(f"FN:{employee.get('FirstName','')} {employee.get('LastName','')}")
-    v.append(f"ORG:{employee.get('Company','')}")
-    v.append(f"TITLE:{employee.get('Position','')}")
-    if employee.get("Phone"):
-        v.append(f"TEL;TYPE=CELL,VOICE:{employee['Phone']}")
-    if employee.get("Email"):
-        v.append(f"EMAIL;TYPE=PREF,INTERNET:{employee['Email']}")
-    if employee.get("Department"):
-        v.append(f"NOTE:Department - {employee['Department']}")
-    if employee.get("Location"):
-        v.append(f"ADR;TYPE=WORK:;;{employee['Location']}")
-    if employee.get("Website"):
-        v.append(f"URL:{employee['Website']}")
-    if employee.get("MapsLink"):
-        v.append(f"URL:{employee['MapsLink']}")
-    if employee.get("Notes"):
-        v.append(f"NOTE:{employee['Notes']}")
+    # Missing values (None/NaN) count as empty, as in clean_employee_frame.
+    fields = {k: str(val).strip() for k, val in employee.items() if not pd.isna(val)}
+    first = fields.get("FirstName", "")
+    last = fields.get("LastName", "")
+    v = [
+        "BEGIN:VCARD",
+        "VERSION:3.0",
+        f"N:{last};{first};;;",
+        f"FN:{first} {last}",
+        f"ORG:{fields.get('Company', '')}",
+        f"TITLE:{fields.get('Position', '')}",
+    ]
+    v += [tmpl.format(fields[key]) for key, tmpl in VCARD_OPTIONAL_FIELDS if fields.get(key)]
     v.append("END:VCARD")
     return "\n".join(v)
 
+def clean_employee_frame(employees_df: pd.DataFrame) -> pd.DataFrame:
+    # Every employee column as stripped strings, with missing cells/columns as "".
+    cleaned = employees_df.reindex(columns=EMPLOYEE_COLUMNS).fillna("").astype(str)
+    return cleaned.apply(lambda col: col.str.strip())
+
+def create_vcards(cleaned_df: pd.DataFrame) -> pd.Series:
+    # Column-wise version of create_vcard for batches: the same lines, built
+    # with a handful of pandas string ops instead of one call per row.
+    first, last = cleaned_df["FirstName"], cleaned_df["LastName"]
+    vcards = (
+        "BEGIN:VCARD\nVERSION:3.0\n"
+        + "N:" + last + ";" + first + ";;;\n"
+        + "FN:" + first + " " + last + "\n"
+        + "ORG:" + cleaned_df["Company"] + "\n"
+        + "TITLE:" + cleaned_df["Position"] + "\n"
+    )
+    for key, tmpl in VCARD_OPTIONAL_FIELDS:
+        col = cleaned_df[key]
+        prefix, suffix = tmpl.split("{}")
+        vcards += (prefix + col + suffix + "\n").where(col != "", "")
+    return vcards + "END:VCARD"
+
 # ------------------------------------------------------------
 # Excel template generators
 # ------------------------------------------------------------
+# The templates are static, so serialize them once instead of on every rerun.
+@st.cache_data(show_spinner=False)
 def generate_employee_template_xlsx() -> bytes:
-    columns = [
-        "FirstName", "LastName", "Position", "Department",
-        "Phone", "Email", "Company", "Website",
-        "Location", "MapsLink", "Notes"
-    ]
     sample_row = [{
         "FirstName": "Abdurrahman",
         "LastName": "Alowain",
@@ -81,12 +156,13 @@ def generate_employee_template_xlsx() -> bytes:
         "MapsLink": "https://maps.app.goo.gl/example",
         "Notes": "Sample entry for testing"
     }]
-    df = pd.DataFrame(sample_row, columns=columns)
+    df = pd.DataFrame(sample_row, columns=EMPLOYEE_COLUMNS)
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine="openpyxl") as writer:
         df.to_excel(writer, index=False, sheet_name="Employees")
     return output.getvalue()
 
+@st.cache_data(show_spinner=False)
 def generate_batch_qr_template_xlsx() -> bytes:
     columns = ["Label", "Data"]
     sample = [{"Label": "Website", "Data": "https://alraedah.sa"}]
@@ -96,79 +172,202 @@ def generate_batch_qr_template_xlsx() -> bytes:
         df.to_excel(writer, index=False, sheet_name="QR_Data")
     return output.getvalue()
 
+# ------------------------------------------------------------
+# Excel upload reader
+# ------------------------------------------------------------
+def read_excel_upload(uploaded_file) -> pd.DataFrame:
+    # The Rust-based calamine engine parses xlsx several times faster than
+    # openpyxl; fall back to the default engine if it is not installed.
+    # Every cell is used as text, so read it as text: no dtype inference, and
+    # a phone column with a blank cell keeps "971500000" instead of turning
+    # into floats that print as "971500000.0".
+    try:
+        return pd.read_excel(uploaded_file, engine="calamine", dtype=str)
+    except ImportError:
+        return pd.read_excel(uploaded_file, dtype=str)
+
+# ------------------------------------------------------------
+# File name helper
+# ------------------------------------------------------------
+# Whitespace/control characters become "_" and characters that are not valid
+# in file or folder names are dropped, all in one str.translate pass.
+_FILENAME_TRANS = str.maketrans({
+    **{chr(i): "_" for i in range(32)},
+    " ": "_",
+    **{c: None for c in '<>:"/\\|?*'},
+})
+
+def sanitize_filename(name: str, fallback: str) -> str:
+    # Leading/trailing dots and spaces are dropped, and a name left with only
+    # dots (".", "..") falls back, so no label can point outside its folder.
+    cleaned = name.strip().strip(". ").translate(_FILENAME_TRANS).strip(".")
+    return cleaned or fallback
+
 # ------------------------------------------------------------
 # ZIP utility
 # ------------------------------------------------------------
-def zip_directory(folder_path: str) -> io.BytesIO:
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(folder_path):
-            for fname in files:
-                fpath = os.path.join(root, fname)
-                arcname = os.path.relpath(fpath, folder_path)
-                zipf.write(fpath, arcname)
-    zip_buffer.seek(0)
-    return zip_buffer
+# Archives larger than this are built on disk instead of in memory.
+ZIP_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+# Once on disk, zipfile's many small header/data writes are coalesced into
+# buffer-sized writes.
+ZIP_SPOOL_BUFFER_BYTES = 1024 * 1024
+
+def zip_directory(folder_path: str) -> bytes:
+    # Streamlit needs the download as bytes anyway; spooling the archive means
+    # large batches are only held in memory once, as that final copy.
+    # A swept or missing run directory must not turn into an empty download.
+    if not os.path.isdir(folder_path):
+        raise FileNotFoundError(f"Batch output folder no longer exists: {folder_path}")
+    with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_BYTES,
+                                      buffering=ZIP_SPOOL_BUFFER_BYTES) as zip_file:
+        with zipfile.ZipFile(zip_file, "w", zipfile.ZIP_STORED) as zipf:
+            for root, _, files in os.walk(folder_path):
+                for fname in files:
+                    fpath = os.path.join(root, fname)
+                    arcname = os.path.relpath(fpath, folder_path)
+                    # PNGs are already deflate-compressed and are stored as-is;
+                    # the text files (svg/vcf/txt) still shrink >10x even at
+                    # the fastest deflate level.
+                    if fname.lower().endswith(".png"):
+                        zipf.write(fpath, arcname)
+                    else:
+                        zipf.write(fpath, arcname, compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+        zip_file.seek(0)
+        return zip_file.read()
 
 # ------------------------------------------------------------
 # Batch exporters
 # ------------------------------------------------------------
-def export_batch_vcards(employees_df: pd.DataFrame, output_dir: str, custom_suffix: str | None = None):
-    date_part = datetime.now().strftime("%Y%m%d")
-    folder_name = f"Batch_QR_vCards_{date_part}" + (f"_{custom_suffix}" if custom_suffix else "")
+def write_vcard_files(emp_dir: str, name: str, vcard: str) -> None:
+    os.makedirs(emp_dir, exist_ok=True)
+    matrix = qr_matrix(vcard)
+    with open(os.path.join(emp_dir, f"{name}.vcf"), "w", encoding="utf-8") as f:
+        f.write(vcard)
+    with open(os.path.join(emp_dir, f"{name}.png"), "wb") as f:
+        write_qr_png(matrix, f)
+    with open(os.path.join(emp_dir, f"{name}.svg"), "wb") as f:
+        f.write(qr_svg_bytes(matrix))
+
+def write_plain_qr_files(data: str, targets: list[tuple[str, str]]) -> None:
+    # One encode per distinct payload, written out for every item that uses it.
+    matrix = qr_matrix(data)
+    svg = qr_svg_bytes(matrix)
+    for item_dir, name in targets:
+        os.makedirs(item_dir, exist_ok=True)
+        with open(os.path.join(item_dir, f"{name}.png"), "wb") as f:
+            write_qr_png(matrix, f)
+        with open(os.path.join(item_dir, f"{name}.svg"), "wb") as f:
+            f.write(svg)
+
+# Run directories of ended sessions are never replaced by a newer run, so any
+# older than this are swept whenever a new run directory is created.
+BATCH_RUN_PREFIX = "qr_batch_"
+BATCH_RUN_MAX_AGE_SECONDS = 24 * 60 * 60
+
+def remove_stale_batch_run_dirs() -> None:
+    cutoff = time.time() - BATCH_RUN_MAX_AGE_SECONDS
+    for entry in os.scandir(tempfile.gettempdir()):
+        if (entry.name.startswith(BATCH_RUN_PREFIX) and entry.is_dir(follow_symlinks=False)
+                and entry.stat(follow_symlinks=False).st_mtime < cutoff):
+            # Another session may be sweeping the same directory right now.
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+@contextmanager
+def new_batch_run_dir(state_key: str):
+    # Every Generate click writes into its own temp directory, and the deferred
+    # ZIP is bound to it, so a download only ever contains that run's files.
+    # The session's previous run for the same tab is only removed once the new
+    # export has succeeded; a failed export removes its own partial output.
+    remove_stale_batch_run_dirs()
+    run_dir = tempfile.mkdtemp(prefix=BATCH_RUN_PREFIX)
+    try:
+        yield run_dir
+    except BaseException:
+        shutil.rmtree(run_dir)
+        raise
+    previous = st.session_state.get(state_key)
+    st.session_state[state_key] = run_dir
+    if previous and os.path.isdir(previous):
+        shutil.rmtree(previous)
+
+def export_batch_vcards(employees_df: pd.DataFrame, output_dir: str, custom_suffix: str | None = None,
+                        on_progress: Callable[[int, int], None] | None = None,
+                        base_name: str | None = None):
+    # The folder is <base_name>_<date> when a base name is given (callers
+    # export into a fresh run directory), otherwise
+    # Batch_QR_vCards_<date>[_<suffix>]. Folder and summary share one timestamp.
+    now = datetime.now()
+    date_part = now.strftime("%Y%m%d")
+    if base_name:
+        folder_name = f"{base_name}_{date_part}"
+    else:
+        suffix = sanitize_filename(custom_suffix or "", "")
+        folder_name = f"Batch_QR_vCards_{date_part}" + (f"_{suffix}" if suffix else "")
     batch_path = os.path.join(output_dir, folder_name)
     os.makedirs(batch_path, exist_ok=True)
 
+    # Keyed by output folder: when two rows share a name the last one wins
+    # instead of writing the same files twice; the summary reports how many
+    # rows were merged that way. Rows without a name get Employee_<n>.
+    cleaned = clean_employee_frame(employees_df)
+    vcards = create_vcards(cleaned)
+    jobs = {}
     count = 0
-    for _, row in employees_df.iterrows():
-        first = str(row.get("FirstName", "")).strip()
-        last = str(row.get("LastName", "")).strip()
-        subfolder = f"{first}_{last}".replace(" ", "_") or "Employee"
-        emp_dir = os.path.join(batch_path, subfolder)
-        os.makedirs(emp_dir, exist_ok=True)
-
-        vcard = create_vcard(row.to_dict())
-        with open(os.path.join(emp_dir, f"{subfolder}.vcf"), "w", encoding="utf-8") as f:
-            f.write(vcard)
-        with open(os.path.join(emp_dir, f"{subfolder}.png"), "wb") as f:
-            f.write(qr_png_bytes(vcard))
-        with open(os.path.join(emp_dir, f"{subfolder}.svg"), "wb") as f:
-            f.write(qr_svg_bytes(vcard))
+    for first, last, vcard in zip(cleaned["FirstName"], cleaned["LastName"], vcards):
         count += 1
+        name = "_".join(part for part in (first, last) if part)
+        subfolder = sanitize_filename(name, f"Employee_{count}")
+        emp_dir = os.path.join(batch_path, subfolder)
+        jobs[emp_dir] = (subfolder, vcard)
+    for done, (emp_dir, (subfolder, vcard)) in enumerate(jobs.items(), start=1):
+        write_vcard_files(emp_dir, subfolder, vcard)
+        if on_progress:
+            on_progress(done, len(jobs))
 
     summary = (
         "Batch vCards Export\n"
-        f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n"
+        f"Date: {now:%Y-%m-%d %H:%M}\n"
         f"Folder: {folder_name}\n"
         f"Total Employees Processed: {count}\n"
     )
+    if len(jobs) < count:
+        summary += f"Rows sharing a name with a later row (not exported): {count - len(jobs)}\n"
     with open(os.path.join(batch_path, "SUMMARY.txt"), "w", encoding="utf-8") as f:
         f.write(summary)
     return batch_path, summary
 
-def export_batch_plain_qr(qr_df: pd.DataFrame, output_dir: str, custom_suffix: str | None = None):
-    date_part = datetime.now().strftime("%Y%m%d")
-    folder_name = f"Batch_QR_Plain_{date_part}" + (f"_{custom_suffix}" if custom_suffix else "")
+def export_batch_plain_qr(qr_df: pd.DataFrame, output_dir: str, custom_suffix: str | None = None,
+                          on_progress: Callable[[int, int], None] | None = None):
+    now = datetime.now()
+    date_part = now.strftime("%Y%m%d")
+    suffix = sanitize_filename(custom_suffix or "", "")
+    folder_name = f"Batch_QR_Plain_{date_part}" + (f"_{suffix}" if suffix else "")
     batch_path = os.path.join(output_dir, folder_name)
     os.makedirs(batch_path, exist_ok=True)
 
+    # Clean both columns once up front instead of building a Series per row.
+    cleaned = qr_df.reindex(columns=["Label", "Data"]).fillna("").astype(str)
+    items = {}
     count = 0
-    for _, row in qr_df.iterrows():
-        label = str(row.get("Label", "")).strip() or f"Item_{count+1}"
-        data = str(row.get("Data", "")).strip()
-        label_sanitized = label.replace(" ", "_")
-        item_dir = os.path.join(batch_path, label_sanitized)
-        os.makedirs(item_dir, exist_ok=True)
-
-        with open(os.path.join(item_dir, f"{label_sanitized}.png"), "wb") as f:
-            f.write(qr_png_bytes(data))
-        with open(os.path.join(item_dir, f"{label_sanitized}.svg"), "wb") as f:
-            f.write(qr_svg_bytes(data))
+    for label, data in zip(cleaned["Label"].str.strip(), cleaned["Data"].str.strip()):
         count += 1
+        label_sanitized = sanitize_filename(label, f"Item_{count}")
+        item_dir = os.path.join(batch_path, label_sanitized)
+        items[item_dir] = (label_sanitized, data)
+
+    # Items sharing the same Data (e.g. one website under several labels) are
+    # grouped so each distinct QR is only encoded once per batch.
+    jobs = {}
+    for item_dir, (label_sanitized, data) in items.items():
+        jobs.setdefault(data, []).append((item_dir, label_sanitized))
+    for done, (data, targets) in enumerate(jobs.items(), start=1):
+        write_plain_qr_files(data, targets)
+        if on_progress:
+            on_progress(done, len(jobs))
 
     summary = (
         "Batch Plain QR Export\n"
-        f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n"
+        f"Date: {now:%Y-%m-%d %H:%M}\n"
         f"Folder: {folder_name}\n"
         f"Total Items Processed: {count}\n"
     )
@@ -179,14 +378,17 @@ def export_batch_plain_qr(qr_df: pd.DataFrame, output_dir: str, custom_suffix: s
 # ------------------------------------------------------------
 # Barcode generator
 # ------------------------------------------------------------
+@st.cache_data(max_entries=128, show_spinner=False)
 def generate_barcode_png(data: str, barcode_type: str = "Code128") -> bytes:
     buf = io.BytesIO()
+    # Barcodes are black on white: render in grayscale ("L") rather than the
+    # writer's default RGB, a third of the pixel data for the PNG encoder.
     if barcode_type == "Code128":
-        Code128(data, writer=ImageWriter()).write(buf)
+        Code128(data, writer=ImageWriter(mode="L")).write(buf)
     elif barcode_type == "EAN13":
         data = "".join(ch for ch in str(data) if ch.isdigit())
         data = data.zfill(12)[:12]
-        EAN13(data, writer=ImageWriter()).write(buf)
+        EAN13(data, writer=ImageWriter(mode="L")).write(buf)
     buf.seek(0)
     return buf.getvalue()
 
@@ -216,10 +418,9 @@ with tabs[0]:
     qr_text = st.text_input("Text or URL", key="tab1_qr_text")
     if st.button("Generate QR", key="tab1_generate"):
         if qr_text.strip():
-            png = qr_png_bytes(qr_text.strip())
-            svg = qr_svg_bytes(qr_text.strip())
+            png, svg = cached_qr_png_svg_bytes(qr_text.strip())
             st.write("QR generated successfully.")
-            st.image(io.BytesIO(png), caption="QR Code")
+            st.image(png, caption="QR Code")
             st.download_button("Download PNG", data=png, file_name="qr.png", mime="image/png", key="tab1_dl_png")
             st.download_button("Download SVG", data=svg, file_name="qr.svg", mime="image/svg+xml", key="tab1_dl_svg")
         else:
@@ -251,9 +452,8 @@ with tabs[1]:
         vcard = create_vcard(emp)
         st.write("vCard generated successfully.")
         st.download_button("Download vCard (.vcf)", data=vcard, file_name=f"{first}_{last}.vcf", mime="text/vcard", key="tab2_dl_vcf")
-        png = qr_png_bytes(vcard)
-        svg = qr_svg_bytes(vcard)
-        st.image(io.BytesIO(png), caption="vCard QR Code")
+        png, svg = cached_qr_png_svg_bytes(vcard)
+        st.image(png, caption="vCard QR Code")
         st.download_button("Download QR (PNG)", data=png, file_name=f"{first}_{last}.png", mime="image/png", key="tab2_dl_png")
         st.download_button("Download QR (SVG)", data=svg, file_name=f"{first}_{last}.svg", mime="image/svg+xml", key="tab2_dl_svg")
 
@@ -269,12 +469,18 @@ with tabs[2]:
 
     if st.button("Generate Batch QR Codes", key="tab3_generate"):
         if uploaded_qr_excel:
-            qr_df = pd.read_excel(uploaded_qr_excel)
-            batch_folder, summary = export_batch_plain_qr(qr_df, ".", custom_suffix=custom_suffix_qr)
-            zip_buf = zip_directory(batch_folder)
+            qr_df = read_excel_upload(uploaded_qr_excel)
+            with st.status("Generating batch QR codes...") as status:
+                progress = st.progress(0.0)
+                with new_batch_run_dir("tab3_run_dir") as run_dir:
+                    batch_folder, summary = export_batch_plain_qr(
+                        qr_df, run_dir, custom_suffix=custom_suffix_qr,
+                        on_progress=lambda done, total: progress.progress(done / total))
+                status.update(state="complete")
             st.write("Batch QR codes generated.")
             st.text_area("Summary", summary, height=180, key="tab3_summary")
-            st.download_button("Download ZIP", data=zip_buf, file_name=f"{os.path.basename(batch_folder)}.zip", mime="application/zip", key="tab3_dl_zip")
+            # The ZIP is only assembled when the download is actually clicked
+            st.download_button("Download ZIP", data=partial(zip_directory, batch_folder), file_name=f"{os.path.basename(batch_folder)}.zip", mime="application/zip", key="tab3_dl_zip", on_click="ignore")
         else:
             st.write("Please upload a valid Excel file.")
 
@@ -290,33 +496,31 @@ with tabs[3]:
 
     if st.button("Generate Batch vCards", key="tab4_generate"):
         if uploaded_emp_excel:
-            emp_df = pd.read_excel(uploaded_emp_excel)
-
-            # Build folder name: CustomName + Date
-            date_part = datetime.now().strftime("%Y%m%d")
-            base_name = custom_suffix_vc.strip() if custom_suffix_vc.strip() else "Batch_vCards"
-            folder_name = f"{base_name}_{date_part}"
+            emp_df = read_excel_upload(uploaded_emp_excel)
 
-            # Generate using existing function
-            batch_folder, summary = export_batch_vcards(emp_df, ".", custom_suffix=None)
+            # Folder name: CustomName + Date, dated by the exporter
+            base_name = sanitize_filename(custom_suffix_vc, "Batch_vCards")
 
-            # Rename folder to our custom rule
-            final_folder = os.path.join(".", folder_name)
-            if os.path.exists(final_folder):
-                import shutil
-                shutil.rmtree(final_folder)
-            os.rename(batch_folder, final_folder)
+            # Generate straight into the custom-named folder of a fresh run directory
+            with st.status("Generating batch vCards...") as status:
+                progress = st.progress(0.0)
+                with new_batch_run_dir("tab4_run_dir") as run_dir:
+                    final_folder, summary = export_batch_vcards(
+                        emp_df, run_dir, base_name=base_name,
+                        on_progress=lambda done, total: progress.progress(done / total))
+                status.update(state="complete")
 
-            # Zip it
-            zip_buf = zip_directory(final_folder)
+            # Zip it lazily, only when the download is clicked
+            zip_buf = partial(zip_directory, final_folder)
 
             st.write("Batch vCards generated successfully.")
             st.text_area("Summary", summary, height=180, key="tab4_summary")
             st.download_button("Download Batch vCards (ZIP)",
                                data=zip_buf,
-                               file_name=f"{folder_name}.zip",
+                               file_name=f"{os.path.basename(final_folder)}.zip",
                                mime="application/zip",
-                               key="tab4_dl_zip")
+                               key="tab4_dl_zip",
+                               on_click="ignore")
         else:
             st.write("Please upload a valid Employee Excel file.")
 
@@ -333,7 +537,7 @@ with tabs[4]:
         if bc_data.strip():
             png = generate_barcode_png(bc_data.strip(), bc_type)
             st.write("Barcode generated.")
-            st.image(io.BytesIO(png), caption="Barcode")
+            st.image(png, caption="Barcode")
             st.download_button("Download Barcode", data=png, file_name=f"{bc_type}_barcode.png", mime="image/png", key="tab5_dl")
         else:
             st.write("Please enter data.")
@@ -360,34 +564,33 @@ with tabs[5]:
 
     if st.button("Generate Employee Directory Package", key="tab6_generate"):
         if uploaded_dir_excel:
-            df = pd.read_excel(uploaded_dir_excel)
+            df = read_excel_upload(uploaded_dir_excel)
             st.write("Preview of uploaded data:")
             st.dataframe(df.head())
 
-            # Build folder name: CustomName + Date (YYYYMMDD)
-            date_part = datetime.now().strftime("%Y%m%d")
-            base_name = custom_name.strip() if custom_name.strip() else "EmployeeDirectory"
-            folder_name = f"{base_name}_{date_part}"
+            # Folder name: CustomName + Date (YYYYMMDD), dated by the exporter
+            base_name = sanitize_filename(custom_name, "EmployeeDirectory")
 
             # Reuse the batch exporter, forcing the folder name
-            batch_folder, summary = export_batch_vcards(df, ".", custom_suffix=None)
-            # Rename the folder to match our custom rule
-            final_folder = os.path.join(".", folder_name)
-            if os.path.exists(final_folder):
-                import shutil
-                shutil.rmtree(final_folder)  # clean if exists
-            os.rename(batch_folder, final_folder)
+            with st.status("Generating employee directory package...") as status:
+                progress = st.progress(0.0)
+                with new_batch_run_dir("tab6_run_dir") as run_dir:
+                    final_folder, summary = export_batch_vcards(
+                        df, run_dir, base_name=base_name,
+                        on_progress=lambda done, total: progress.progress(done / total))
+                status.update(state="complete")
 
-            # Zip it
-            zip_buf = zip_directory(final_folder)
+            # Zip it lazily, only when the download is clicked
+            zip_buf = partial(zip_directory, final_folder)
 
             st.write("Employee directory package generated successfully.")
             st.text_area("Summary", summary, height=180, key="tab6_summary")
             st.download_button("Download Employee Directory Package (ZIP)",
                                data=zip_buf,
-                               file_name=f"{folder_name}.zip",
+                               file_name=f"{os.path.basename(final_folder)}.zip",
                                mime="application/zip",
-                               key="tab6_dl_zip")
+                               key="tab6_dl_zip",
+                               on_click="ignore")
         else:
             st.write("Please upload a valid Employee Excel file.")
 